@@ -0,0 +1,119 @@
+"""
+A helper process for ``allmydata.test.test_runner`` which runs the main Tahoe
+entrypoint many times without paying the interpreter start-up and import
+costs each time.
+
+The process imports ``allmydata.scripts.runner`` once and then reads requests
+from stdin, one JSON object per line.  For each request it forks a child which
+runs the entrypoint with the requested argv, exactly as ``python -m
+allmydata.scripts.runner`` would, with its stdout and stderr captured.  The
+result is written back to stdout as a single JSON line.
+
+This relies on ``os.fork`` so it is only usable on POSIX.
+
+It lives outside ``allmydata.test`` because importing that package has
+global side-effects (opening ``eliot.log``, patching foolscap, and so on)
+which would otherwise be inherited by every run of the entrypoint.
+
+Ported to Python 3.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from future.utils import PY2
+if PY2:
+    from future.builtins import filter, map, zip, ascii, chr, hex, input, next, oct, open, pow, round, super, bytes, dict, list, object, range, str, max, min  # noqa: F401
+
+import os
+import sys
+import traceback
+from base64 import b64decode, b64encode
+from json import dumps, loads
+from tempfile import TemporaryFile
+
+# Pay for this import once, here, instead of in every child.
+from allmydata.scripts import runner
+
+
+def _decode_argv(encoded):
+    """
+    Turn the base64-encoded argv bytes from a request into the values a real
+    process would find in ``sys.argv``: bytes on Python 2, and text decoded
+    the way the interpreter decodes the OS argv on Python 3.
+    """
+    argv = [b64decode(arg) for arg in encoded]
+    if PY2:
+        return argv
+    return [os.fsdecode(arg) for arg in argv]
+
+
+def _run_child(request, stdout, stderr):
+    """
+    Run the entrypoint in a freshly forked child.  Never returns.
+    """
+    rc = 1
+    try:
+        os.chdir(request["cwd"])
+        argv = _decode_argv(request["argv"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout.fileno(), 1)
+        os.dup2(stderr.fileno(), 2)
+        sys.argv = [runner.__file__] + argv
+        runner.run()
+    except SystemExit as e:
+        if e.code is None:
+            rc = 0
+        elif isinstance(e.code, int):
+            rc = e.code
+        else:
+            print(e.code, file=sys.stderr)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(rc)
+
+
+def _run_one(request):
+    """
+    Run the entrypoint once, as described by ``request``.
+
+    :return: A three-list of base64-encoded stdout, base64-encoded stderr,
+        and the child's exit code.
+    """
+    with TemporaryFile() as stdout, TemporaryFile() as stderr:
+        pid = os.fork()
+        if pid == 0:
+            _run_child(request, stdout, stderr)
+
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            rc = -os.WTERMSIG(status)
+        else:
+            rc = os.WEXITSTATUS(status)
+
+        result = []
+        for f in (stdout, stderr):
+            f.seek(0)
+            result.append(b64encode(f.read()).decode("ascii"))
+        result.append(rc)
+        return result
+
+
+def main():
+    # Keep the results channel for ourselves.  Children get their own stdout.
+    responses = os.fdopen(os.dup(1), "w")
+    sys.stdout.flush()
+
+    for line in iter(sys.stdin.readline, ""):
+        responses.write(dumps(_run_one(loads(line))) + "\n")
+        responses.flush()
+
+
+if __name__ == "__main__":
+    main()
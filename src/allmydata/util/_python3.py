@@ -147,6 +147,7 @@ PORTED_MODULES = [
     "allmydata.test.web.common",
     "allmydata.test.web.matchers",
     "allmydata.testing",
+    "allmydata.testing._bintahoe_server",
     "allmydata.testing.web",
     "allmydata.unknown",
     "allmydata.uri",